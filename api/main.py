@@ -3,17 +3,32 @@ from dotenv import load_dotenv
 # untuk memuat environment variables sebelum modul lain diimpor.
 load_dotenv()
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from routers import analyze
+from utils import youtube
 import os
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Satu connection pool HTTP untuk semua panggilan keluar,
+    # agar handshake TCP+TLS tidak diulang di setiap request
+    youtube.get_client()
+    try:
+        yield
+    finally:
+        await youtube.close_client()
+
 app = FastAPI(
     title="Rainative AI API",
     description="AI-powered content analysis and viral prediction API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware configuration
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Union
+from typing import Any, List, Dict, Optional, Union
 from datetime import datetime
 
 class AnalyzeRequest(BaseModel):
@@ -43,6 +43,18 @@ class AnalyzeResponse(BaseModel):
     recommendations: ContentRecommendation = Field(..., description="Content recommendations")
     doc_summary: Optional[str] = Field(None, description="Document summary if file was analyzed")
 
+class AnalysisTaskResponse(BaseModel):
+    """Response model for a queued background analysis."""
+    task_id: str = Field(..., description="Background analysis task ID")
+    status: str = Field(..., description="Task status: pending, running, completed or failed")
+
+class AnalysisStatusResponse(BaseModel):
+    """Status of a background analysis, including any result fields completed so far."""
+    task_id: str = Field(..., description="Background analysis task ID")
+    status: str = Field(..., description="Task status: pending, running, completed or failed")
+    result: Optional[Dict[str, Any]] = Field(None, description="Partial or complete AnalyzeResponse fields")
+    error: Optional[str] = Field(None, description="Error message if the task failed")
+
 class ErrorResponse(BaseModel):
     """Error response model."""
     error: str = Field(..., description="Error message")
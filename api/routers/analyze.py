@@ -1,21 +1,37 @@
 # api/routers/analyze.py
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from models.schemas import AnalyzeRequest, AnalyzeResponse
+from fastapi import APIRouter, BackgroundTasks, HTTPException, UploadFile, File
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
+from models.schemas import (
+    AnalyzeRequest,
+    AnalyzeResponse,
+    AnalysisStatusResponse,
+    AnalysisTaskResponse,
+    ContentRecommendation,
+    TimelineItem,
+    VideoMetadata
+)
+from pydantic import TypeAdapter
 from services.transcriber import TranscriberService, VideoProcessingError
-from services.viral import ViralAnalysisService
+from services.viral import ViralAnalysisService, get_viral_label
 from services.gemini_utils import (
     summarize_transcript, 
     explain_why_viral, 
     generate_content_idea,
-    summarize_document
+    summarize_segment,
+    summarize_transcripts_batch
 )
 from utils import youtube
+from utils.cache import ResponseCache, TaskStore, consume_exception, record_fallback, track_fallbacks
+import asyncio
+import json
 import logging
 import tempfile
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+from uuid import uuid4
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -24,62 +40,300 @@ logger = logging.getLogger(__name__)
 transcriber_service = TranscriberService()
 viral_service = ViralAnalysisService()
 
+# Batas segmen timeline dan jumlah ringkasan segmen yang berjalan bersamaan
+MAX_TIMELINE_CHUNKS = 8
+TIMELINE_CONCURRENCY = 4
+
+# Cache respons analisis per video ID agar video yang sama tidak dianalisis ulang
+ANALYZE_CACHE_TTL = 86400
+analyze_cache = ResponseCache(ttl=ANALYZE_CACHE_TTL)
+
+# Status background task analisis (lihat /analyze/jobs)
+task_store = TaskStore(prefix="analyze:task:")
+
+# Penjelasan viral standar untuk dokumen (tidak ada data views/likes)
+DOCUMENT_VIRAL_EXPLANATION = (
+    "This document contains valuable insights and information that could be adapted into engaging content. "
+    "The content quality and structure suggest good potential for creating viral social media posts, videos, or articles."
+)
+
+# Skema respons dibangun sekali saat import, bukan di setiap request
+_ANALYZE_RESPONSE = TypeAdapter(AnalyzeResponse)
+
+# Callback untuk melaporkan field hasil yang sudah selesai: (nama_field, nilai)
+ProgressCallback = Callable[[str, Any], Awaitable[None]]
+
+def canonical_url(youtube_url: str) -> Tuple[str, str]:
+    """
+    Validasi URL YouTube dan ubah ke bentuk kanonik `watch?v=`.
+
+    Menyeragamkan youtu.be, m.youtube.com, shorts, embed, dan parameter pelacak seperti `?si=`
+    sehingga URL yang sama selalu menghasilkan cache key yang sama.
+    Mengembalikan (url_kanonik, video_id); URL yang tidak valid langsung ditolak dengan 400.
+    """
+    video_id = youtube.extract_video_id(youtube_url)
+    if not video_id:
+        raise HTTPException(status_code=400, detail="Invalid YouTube URL.")
+    return f"https://www.youtube.com/watch?v={video_id}", video_id
+
+def _discard_task(*tasks: Optional[asyncio.Task]) -> None:
+    """Batalkan task yang hasilnya tidak lagi dibutuhkan tanpa memicu warning 'exception never retrieved'."""
+    for task in tasks:
+        if task is None:
+            continue
+        task.cancel()
+        task.add_done_callback(consume_exception)
+
 @router.post("/analyze", response_model=AnalyzeResponse)
 async def analyze_content(request: AnalyzeRequest):
     if not request.youtube_url:
         raise HTTPException(status_code=400, detail="youtube_url must be provided")
 
-    logger.info(f"Analyzing YouTube content: {request.youtube_url}")
+    youtube_url, video_id = canonical_url(request.youtube_url)
+    logger.info("Analyzing YouTube content: %s", youtube_url)
+
+    # Cache menyimpan JSON final, jadi bisa dikirim langsung tanpa validasi ulang
+    cached = await analyze_cache.get(_cache_key(video_id))
+    if cached:
+        logger.info("Returning cached analysis for video ID: %s", video_id)
+        return Response(content=cached, media_type="application/json")
+
+    with track_fallbacks() as fallbacks:
+        response = await _analyze_youtube(youtube_url)
+    payload = await _store_analysis(video_id, response, fallbacks)
+    return Response(content=payload, media_type="application/json")
+
+@router.post("/analyze/stream")
+async def analyze_content_stream(request: AnalyzeRequest):
+    """
+    Stream hasil analisis sebagai Server-Sent Events.
+
+    Setiap field dikirim sebagai event begitu selesai (urutan selesai, bukan urutan definisi),
+    diakhiri event `complete` berisi AnalyzeResponse lengkap atau event `error`.
+    """
+    if not request.youtube_url:
+        raise HTTPException(status_code=400, detail="youtube_url must be provided")
+
+    youtube_url, video_id = canonical_url(request.youtube_url)
+    logger.info("Streaming analysis for YouTube content: %s", youtube_url)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_progress(field: str, value: Any) -> None:
+        await queue.put((field, value))
+
+    async def run_pipeline() -> None:
+        try:
+            response = await _analyze_with_cache(youtube_url, video_id, on_progress)
+            await queue.put(("complete", response))
+        except HTTPException as e:
+            await queue.put(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            logger.error("Streaming analysis failed unexpectedly: %s", e, exc_info=True)
+            await queue.put(("error", {"status_code": 500, "detail": "An internal server error occurred on the server."}))
+        finally:
+            await queue.put(None)
+
+    async def event_stream():
+        pipeline_task = asyncio.create_task(run_pipeline())
+        try:
+            while (item := await queue.get()) is not None:
+                event, data = item
+                yield _format_sse(event, data)
+        finally:
+            # Klien terputus sebelum selesai: hentikan pipeline
+            if not pipeline_task.done():
+                _discard_task(pipeline_task)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _format_sse(event: str, data: Any) -> str:
+    """Format satu event Server-Sent Events dengan data JSON."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@router.post("/analyze/jobs", response_model=AnalysisTaskResponse, status_code=202)
+async def submit_analysis(request: AnalyzeRequest, background_tasks: BackgroundTasks):
+    """Jalankan analisis di background dan langsung kembalikan task ID untuk di-poll."""
+    if not request.youtube_url:
+        raise HTTPException(status_code=400, detail="youtube_url must be provided")
+
+    youtube_url, video_id = canonical_url(request.youtube_url)
+    task_id = uuid4().hex
+    await task_store.update(task_id, status="pending")
+    background_tasks.add_task(_run_analysis, task_id, youtube_url, video_id)
+    logger.info("Queued analysis task %s for: %s", task_id, youtube_url)
+    return AnalysisTaskResponse(task_id=task_id, status="pending")
+
+@router.get("/analyze/jobs/{task_id}", response_model=AnalysisStatusResponse)
+async def get_analysis_status(task_id: str):
+    """Kembalikan status task beserta field hasil yang sudah selesai."""
+    task = await task_store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Analysis task not found.")
+
+    status = task.pop("status", "pending")
+    error = task.pop("error", None)
+    return AnalysisStatusResponse(task_id=task_id, status=status, result=task or None, error=error)
+
+async def _run_analysis(task_id: str, youtube_url: str, video_id: str) -> None:
+    """Background job: jalankan analisis dan simpan setiap field hasil begitu selesai."""
+    await task_store.update(task_id, status="running")
+
+    async def on_progress(field: str, value: Any) -> None:
+        await task_store.update(task_id, **{field: jsonable_encoder(value)})
 
     try:
-        # 1. Dapatkan Metadata Video
-        video_metadata = await youtube.get_video_metadata(request.youtube_url)
+        response = await _analyze_with_cache(youtube_url, video_id, on_progress)
+        await task_store.update(task_id, status="completed", **jsonable_encoder(response))
+    except HTTPException as e:
+        await task_store.update(task_id, status="failed", error=str(e.detail))
+    except Exception as e:
+        logger.error("Analysis task %s failed unexpectedly: %s", task_id, e, exc_info=True)
+        await task_store.update(task_id, status="failed", error="An internal server error occurred on the server.")
+
+async def _report(coro: Awaitable[Any], field: str, on_progress: Optional[ProgressCallback]) -> Any:
+    """Tunggu coroutine lalu laporkan hasilnya sebagai field `field`."""
+    value = await coro
+    if on_progress:
+        await on_progress(field, value)
+    return value
+
+async def _summarize_and_recommend(
+    transcript: str,
+    video_metadata: VideoMetadata,
+    on_progress: Optional[ProgressCallback]
+) -> Tuple[str, str, ContentRecommendation]:
+    """Ringkasan, lalu penjelasan viral (butuh ringkasan), lalu rekomendasi (butuh keduanya)."""
+    overall_summary = await _report(summarize_transcript(transcript), "summary", on_progress)
+    viral_explanation = await _report(
+        explain_why_viral(
+            video_metadata.title, 
+            video_metadata.view_count or 0, 
+            video_metadata.like_count or 0, 
+            overall_summary
+        ),
+        "viral_explanation",
+        on_progress,
+    )
+    recommendations = await _report(
+        generate_content_idea("general", overall_summary, viral_explanation),
+        "recommendations",
+        on_progress,
+    )
+    return overall_summary, viral_explanation, recommendations
+
+async def _analyze_with_cache(
+    youtube_url: str,
+    video_id: str,
+    on_progress: Optional[ProgressCallback] = None
+) -> AnalyzeResponse:
+    """Kembalikan analisis dari cache jika ada, jika tidak jalankan pipeline dan simpan hasilnya."""
+    cached = await analyze_cache.get(_cache_key(video_id))
+    if cached:
+        logger.info("Returning cached analysis for video ID: %s", video_id)
+        return _ANALYZE_RESPONSE.validate_json(cached)
+
+    with track_fallbacks() as fallbacks:
+        response = await _analyze_youtube(youtube_url, on_progress)
+    await _store_analysis(video_id, response, fallbacks)
+    return response
+
+def _cache_key(video_id: str) -> str:
+    return f"analyze:v1:{video_id}"
+
+async def _store_analysis(video_id: str, response: AnalyzeResponse, fallbacks: Set[str]) -> bytes:
+    """
+    Serialisasi respons dengan serializer Rust pydantic-core, simpan ke cache, dan kembalikan JSON-nya.
+
+    Respons yang memakai fallback (`fallbacks` tidak kosong, lihat record_fallback) tidak di-cache,
+    agar kegagalan sementara Gemini, yt-dlp, atau Whisper tidak tersimpan selama ANALYZE_CACHE_TTL.
+    """
+    payload = _ANALYZE_RESPONSE.dump_json(response)
+    if fallbacks:
+        logger.warning("Not caching analysis for video ID %s; fallback used for: %s", video_id, ", ".join(sorted(fallbacks)))
+    else:
+        await analyze_cache.set(_cache_key(video_id), payload.decode())
+    return payload
+
+async def clear_cached_analysis(video_id: str) -> None:
+    """Hapus analisis ter-cache untuk `video_id` bersama cache transkrip, misalnya sebelum transkripsi ulang secara manual."""
+    transcriber_service.cache_clear()
+    await analyze_cache.delete(_cache_key(video_id))
+
+async def _analyze_youtube(youtube_url: str, on_progress: Optional[ProgressCallback] = None) -> AnalyzeResponse:
+    """
+    Pipeline analisis video YouTube.
+
+    `on_progress(field, value)` dipanggil setiap kali satu field hasil selesai,
+    sehingga pemanggil bisa meneruskan hasil parsial.
+    """
+    try:
+        # 1. Mulai ekstraksi transkrip sambil mengambil metadata video,
+        #    keduanya memanggil endpoint YouTube yang tidak saling bergantung
+        transcript_task = asyncio.create_task(transcriber_service.get_transcript(youtube_url))
+        try:
+            video_metadata = await youtube.get_video_metadata(youtube_url)
+        except youtube.YouTubeRateLimited as e:
+            _discard_task(transcript_task)
+            logger.warning("YouTube API rate limited; asking client to retry after %ss", e.retry_after)
+            raise HTTPException(
+                status_code=503,
+                detail="YouTube API rate limit reached. Please try again later.",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except Exception:
+            _discard_task(transcript_task)
+            raise
         if not video_metadata:
+            _discard_task(transcript_task)
             raise HTTPException(status_code=404, detail="Invalid YouTube URL or video not found.")
+        if on_progress:
+            await on_progress("video_metadata", video_metadata)
 
-        # 2. Dapatkan Transkrip (menggunakan service yang sudah diubah)
+        # 2. Tunggu Transkrip (menggunakan service yang sudah diubah)
         transcript = ""
         try:
-            transcript = await transcriber_service.get_transcript(request.youtube_url)
+            transcript = await transcript_task
             if not transcript or len(transcript.strip()) < 20:
                 raise HTTPException(status_code=422, detail="Transcript is too short or empty. Analysis cannot proceed.")
         except VideoProcessingError as e:
             # Menangkap error spesifik dari Pytube dan menampilkannya dengan jelas
-            logger.error(f"Video processing failed for URL {request.youtube_url}: {e}")
+            logger.error("Video processing failed for URL %s: %s", youtube_url, e)
             raise HTTPException(status_code=422, detail=str(e))
         except Exception as e:
-            logger.error(f"Transcript extraction failed unexpectedly: {e}", exc_info=True)
+            logger.error("Transcript extraction failed unexpectedly: %s", e, exc_info=True)
             raise HTTPException(status_code=500, detail="An unexpected error occurred while extracting video content.")
 
-        # 3. Hasilkan Ringkasan dan Analisis dengan Gemini
-        overall_summary = await summarize_transcript(transcript)
-        viral_explanation = await explain_why_viral(
-            video_metadata.title, 
-            video_metadata.view_count or 0, 
-            video_metadata.like_count or 0, 
-            overall_summary
-        )
-        recommendations = await generate_content_idea("general", overall_summary, viral_explanation)
-        
-        # 4. Hitung Skor Viral
-        viral_score = await viral_service.calculate_viral_score(
-            transcript,
-            video_metadata.title,
-            video_metadata.view_count or 0,
-            video_metadata.like_count or 0
+        # 3. Timeline tidak dibutuhkan langkah lain, jalankan di background dan tunggu paling akhir
+        timeline_task = asyncio.create_task(
+            _report(_generate_timeline_summary(transcript, video_metadata.duration), "timeline_summary", on_progress)
         )
+        try:
+            # 4. Rantai ringkasan -> penjelasan -> rekomendasi berjalan bersamaan dengan skor viral
+            (overall_summary, viral_explanation, recommendations), viral_score = await asyncio.gather(
+                _summarize_and_recommend(transcript, video_metadata, on_progress),
+                _report(
+                    viral_service.calculate_viral_score(
+                        transcript,
+                        video_metadata.title,
+                        video_metadata.view_count or 0,
+                        video_metadata.like_count or 0
+                    ),
+                    "viral_score",
+                    on_progress,
+                ),
+            )
+            timeline_summary = await timeline_task
+        except BaseException:
+            _discard_task(timeline_task)
+            raise
         
         # 5. Tentukan Label Viral
-        if viral_score >= 80:
-            viral_label = "Very High Potential"
-        elif viral_score >= 60:
-            viral_label = "Good Potential"
-        else:
-            viral_label = "Needs Improvement"
+        viral_label = get_viral_label(viral_score)
         
-        # Placeholder untuk ringkasan timeline (bisa diimplementasikan nanti)
-        timeline_summary = []
-
         # 6. Kembalikan Respons Lengkap
         return AnalyzeResponse(
             video_metadata=video_metadata,
@@ -94,13 +348,91 @@ async def analyze_content(request: AnalyzeRequest):
     except HTTPException:
         raise # Lemparkan kembali HTTPException agar ditangani oleh FastAPI
     except Exception as e:
-        logger.error(f"An unexpected server error occurred during analysis: {e}", exc_info=True)
+        logger.error("An unexpected server error occurred during analysis: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="An internal server error occurred on the server.")
 
+def _format_timestamp(seconds: int) -> str:
+    """Format detik menjadi 'MM:SS' atau 'HH:MM:SS'."""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+async def _generate_timeline_summary(transcript: str, duration: int) -> List[TimelineItem]:
+    """Bagi transkrip menjadi segmen waktu dan ringkas semua segmen dalam satu panggilan Gemini."""
+    # split dengan maxsplit cukup untuk mengecek minimal 10 kata tanpa memecah seluruh transkrip
+    if len(transcript.split(None, 10)) < 10 or duration <= 0:
+        return []
+
+    # Kira-kira satu segmen per menit, minimal 2 dan maksimal MAX_TIMELINE_CHUNKS
+    num_chunks = max(2, min(MAX_TIMELINE_CHUNKS, duration // 60))
+    chunk_duration = duration / num_chunks
+
+    # Potong berdasarkan offset karakter, digeser ke spasi berikutnya agar kata tidak terpotong
+    n = len(transcript)
+    boundaries = [0]
+    for i in range(1, num_chunks):
+        boundary = transcript.find(" ", max(i * n // num_chunks, boundaries[-1]))
+        boundaries.append(n if boundary == -1 else boundary)
+    boundaries.append(n)
+
+    chunks = []
+    for i in range(num_chunks):
+        chunk_text = transcript[boundaries[i]:boundaries[i + 1]].strip()
+        if not chunk_text:
+            continue
+        start_time = int(i * chunk_duration)
+        end_time = int((i + 1) * chunk_duration)
+        chunks.append((i, start_time, end_time, chunk_text))
+
+    # Satu prompt Gemini untuk semua segmen. Hanya jika jawabannya tidak bisa diurai, ringkas per
+    # segmen secara paralel; jika Gemini sendiri gagal (mis. kuota habis setelah retry), timeline
+    # dilewati agar tidak memicu lonjakan panggilan per segmen
+    try:
+        summaries = await summarize_transcripts_batch([chunk_text for _, _, _, chunk_text in chunks])
+    except ValueError as e:  # termasuk json.JSONDecodeError
+        logger.warning("Batch timeline summary could not be parsed, summarizing segments individually: %s", e)
+        return await _summarize_timeline_chunks(chunks)
+    except Exception as e:
+        logger.warning("Batch timeline summary failed, skipping timeline: %s", e)
+        record_fallback("timeline_summary")
+        return []
+
+    return [
+        TimelineItem(
+            timestamp=f"{_format_timestamp(start_time)} - {_format_timestamp(end_time)}",
+            summary=summary,
+        )
+        for (_, start_time, end_time, _), summary in zip(chunks, summaries)
+    ]
+
+async def _summarize_timeline_chunks(chunks: List[Tuple[int, int, int, str]]) -> List[TimelineItem]:
+    """Ringkas setiap segmen timeline dengan panggilan Gemini terpisah yang berjalan paralel."""
+    # Batasi jumlah panggilan Gemini yang berjalan bersamaan
+    semaphore = asyncio.Semaphore(TIMELINE_CONCURRENCY)
+
+    async def _summarize_chunk(i: int, start_time: int, end_time: int, chunk_text: str) -> Optional[TimelineItem]:
+        async with semaphore:
+            try:
+                summary = await summarize_segment(chunk_text)
+            except Exception as e:
+                logger.warning("Failed to summarize timeline chunk %s: %s", i, e)
+                record_fallback("timeline_summary")
+                return None
+        return TimelineItem(
+            timestamp=f"{_format_timestamp(start_time)} - {_format_timestamp(end_time)}",
+            summary=summary,
+        )
+
+    # gather mempertahankan urutan input, jadi urutan timeline tetap terjaga
+    results = await asyncio.gather(*(_summarize_chunk(*chunk) for chunk in chunks))
+    return [item for item in results if item is not None]
+
 @router.post("/analyze-document", response_model=AnalyzeResponse)
 async def analyze_document(file: UploadFile = File(...)):
     """Analyze uploaded document content."""
-    logger.info(f"Analyzing document: {file.filename}")
+    logger.info("Analyzing document: %s", file.filename)
     
     # Validate file type
     allowed_extensions = {'.pdf', '.doc', '.docx', '.txt', '.ppt', '.pptx'}
@@ -126,29 +458,25 @@ async def analyze_document(file: UploadFile = File(...)):
             if not document_text or len(document_text.strip()) < 20:
                 raise HTTPException(status_code=422, detail="Document content is too short or empty.")
             
-            # Generate summary and analysis
-            overall_summary = await summarize_transcript(document_text)
-            
+            # Generate summary and viral score concurrently
             # For documents, we'll use a simplified viral analysis
-            viral_score = await viral_service.calculate_viral_score(
-                document_text,
-                file.filename or "Document",
-                0,  # No views for documents
-                0   # No likes for documents
+            overall_summary, viral_score = await asyncio.gather(
+                summarize_transcript(document_text),
+                viral_service.calculate_viral_score(
+                    document_text,
+                    file.filename or "Document",
+                    0,  # No views for documents
+                    0   # No likes for documents
+                ),
             )
             
             # Generate explanation and recommendations
-            viral_explanation = f"This document contains valuable insights and information that could be adapted into engaging content. The content quality and structure suggest good potential for creating viral social media posts, videos, or articles."
+            viral_explanation = DOCUMENT_VIRAL_EXPLANATION
             
             recommendations = await generate_content_idea("document", overall_summary, viral_explanation)
             
             # Determine viral label
-            if viral_score >= 80:
-                viral_label = "Very High Potential"
-            elif viral_score >= 60:
-                viral_label = "Good Potential"
-            else:
-                viral_label = "Needs Improvement"
+            viral_label = get_viral_label(viral_score)
             
             return AnalyzeResponse(
                 video_metadata=None,
@@ -166,12 +494,12 @@ async def analyze_document(file: UploadFile = File(...)):
             try:
                 os.unlink(temp_file_path)
             except Exception as e:
-                logger.warning(f"Failed to delete temporary file: {e}")
+                logger.warning("Failed to delete temporary file: %s", e)
                 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Document analysis failed: {e}", exc_info=True)
+        logger.error("Document analysis failed: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to analyze document.")
 
 async def extract_text_from_document(file_path: str, file_extension: str) -> str:
@@ -218,5 +546,5 @@ async def extract_text_from_document(file_path: str, file_extension: str) -> str
             raise ValueError(f"Unsupported file type: {file_extension}")
             
     except Exception as e:
-        logger.error(f"Failed to extract text from {file_extension} file: {e}")
+        logger.error("Failed to extract text from %s file: %s", file_extension, e)
         raise Exception(f"Failed to process {file_extension} file")
\ No newline at end of file
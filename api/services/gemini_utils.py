@@ -1,12 +1,23 @@
 import os
+import asyncio
 import logging
 from typing import Dict, List
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from models.schemas import ContentRecommendation
+from utils.cache import async_cache, record_fallback
 import json
 
 logger = logging.getLogger(__name__)
 
+# Cap on concurrent Gemini requests across the whole process, kept below the provider quota
+GEMINI_MAX_INFLIGHT = int(os.getenv("GEMINI_MAX_INFLIGHT", "16"))
+_GEMINI_SEM = asyncio.Semaphore(GEMINI_MAX_INFLIGHT)
+
+# Rate limit (429) and transient unavailability are retried with exponential backoff
+_RETRYABLE_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable)
+
 class GeminiService:
     """Service for interacting with Google Gemini AI."""
 
@@ -24,21 +35,38 @@ class GeminiService:
             logger.error("GEMINI_API_KEY not found. GeminiService cannot function.")
             self.model = None
 
+    @async_cache(ttl=3600, maxsize=10000)
     async def _generate_content(self, prompt: str) -> str:
-        """Generate content using Gemini API with error handling."""
+        """
+        Generate content using Gemini API with error handling.
+
+        Identical prompts are answered from cache, and concurrent identical
+        prompts share a single in-flight request. Failures are not cached.
+        At most GEMINI_MAX_INFLIGHT requests run at once; 429/503 responses
+        are retried up to 4 attempts with jittered exponential backoff.
+        """
         if not self.model:
             raise Exception("Gemini model is not initialized. Please check your GEMINI_API_KEY.")
 
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    top_p=0.8,
-                    top_k=40,
-                    max_output_tokens=2048,
-                )
-            )
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception_type(_RETRYABLE_ERRORS),
+                wait=wait_exponential_jitter(initial=2, max=10),
+                stop=stop_after_attempt(4),
+                reraise=True,
+            ):
+                with attempt:
+                    # The semaphore is held per attempt, never while backing off
+                    async with _GEMINI_SEM:
+                        response = await self.model.generate_content_async(
+                            prompt,
+                            generation_config=genai.types.GenerationConfig(
+                                temperature=0.7,
+                                top_p=0.8,
+                                top_k=40,
+                                max_output_tokens=2048,
+                            )
+                        )
 
             if not response.text:
                 raise Exception("Gemini returned empty response")
@@ -58,6 +86,19 @@ async def summarize_transcript(transcript_chunk: str) -> str:
     if not transcript_chunk or len(transcript_chunk.strip()) < 10:
         return "No content available to summarize."
 
+    try:
+        return await summarize_segment(transcript_chunk)
+    except Exception as e:
+        logger.error(f"Error summarizing transcript: {e}")
+        record_fallback("summary")
+        return "Unable to generate summary at this time."
+
+async def summarize_segment(transcript_chunk: str) -> str:
+    """
+    Summarize a transcript chunk with the same prompt as summarize_transcript.
+
+    Raises on Gemini errors instead of returning a placeholder, so callers can drop the segment.
+    """
     prompt = f"""
     Please provide a comprehensive and engaging summary of the following content in 3-4 sentences.
     Focus on the key points, main insights, and valuable information that viewers would find most interesting:
@@ -73,12 +114,42 @@ async def summarize_transcript(transcript_chunk: str) -> str:
     Summary:
     """
 
-    try:
-        summary = await gemini_service._generate_content(prompt)
-        return summary.strip()
-    except Exception as e:
-        logger.error(f"Error summarizing transcript: {e}")
-        return "Unable to generate summary at this time."
+    summary = await gemini_service._generate_content(prompt)
+    return summary.strip()
+
+async def summarize_transcripts_batch(transcript_chunks: List[str]) -> List[str]:
+    """
+    Summarize several transcript segments with a single Gemini request.
+
+    Raises an exception when the response cannot be parsed into exactly one
+    summary per segment, so callers can fall back to summarize_transcript.
+    """
+    if not transcript_chunks:
+        return []
+
+    segments = "\n\n".join(
+        f'Segment {i}: "{chunk[:4000]}"' for i, chunk in enumerate(transcript_chunks, start=1)
+    )
+    prompt = f"""
+    Summarize each of the following {len(transcript_chunks)} consecutive segments of the same content.
+    Write 2-3 clear, engaging sentences per segment that capture its key points.
+
+    {segments}
+
+    Return valid JSON only, with exactly {len(transcript_chunks)} summaries in segment order:
+    {{"summaries": ["Summary of segment 1", "Summary of segment 2"]}}
+
+    JSON Response:
+    """
+
+    response_text = await gemini_service._generate_content(prompt)
+    data = json.loads(_clean_json_response(response_text))
+
+    summaries = data.get("summaries") if isinstance(data, dict) else None
+    if not isinstance(summaries, list) or len(summaries) != len(transcript_chunks):
+        raise ValueError(f"Expected {len(transcript_chunks)} summaries from Gemini, got: {str(summaries)[:200]}")
+
+    return [str(summary).strip() for summary in summaries]
 
 async def explain_why_viral(title: str, views: int, likes: int, summary: str) -> str:
     """
@@ -108,6 +179,7 @@ async def explain_why_viral(title: str, views: int, likes: int, summary: str) ->
         return explanation.strip()
     except Exception as e:
         logger.error(f"Error generating viral explanation: {e}")
+        record_fallback("viral_explanation")
         return "This content shows strong viral potential due to its engaging topic and presentation style."
 
 async def generate_content_idea(category: str, summary: str, reason: str) -> ContentRecommendation:
@@ -153,20 +225,7 @@ async def generate_content_idea(category: str, summary: str, reason: str) -> Con
         response_text = await gemini_service._generate_content(prompt)
 
         # Clean and parse JSON response
-        clean_json_text = response_text.strip()
-
-        # Remove markdown code blocks if present
-        if clean_json_text.startswith('```json'):
-            clean_json_text = clean_json_text[7:]
-        if clean_json_text.startswith('```'):
-            clean_json_text = clean_json_text[3:]
-        if clean_json_text.endswith('```'):
-            clean_json_text = clean_json_text[:-3]
-
-        clean_json_text = clean_json_text.strip()
-
-        # Parse JSON
-        data = json.loads(clean_json_text)
+        data = json.loads(_clean_json_response(response_text))
 
         # Validate and create ContentRecommendation
         recommendation = ContentRecommendation(**data)
@@ -175,11 +234,27 @@ async def generate_content_idea(category: str, summary: str, reason: str) -> Con
     except json.JSONDecodeError as e:
         logger.error(f"JSON parsing error in content recommendation: {e}")
         logger.error(f"Raw response: {response_text[:500]}...")
+        record_fallback("recommendations")
         return _create_fallback_recommendation()
     except Exception as e:
         logger.error(f"Error generating content idea: {str(e)}")
+        record_fallback("recommendations")
         return _create_fallback_recommendation()
 
+def _clean_json_response(response_text: str) -> str:
+    """Strip whitespace and markdown code fences from a Gemini JSON response."""
+    clean_json_text = response_text.strip()
+
+    # Remove markdown code blocks if present
+    if clean_json_text.startswith('```json'):
+        clean_json_text = clean_json_text[7:]
+    if clean_json_text.startswith('```'):
+        clean_json_text = clean_json_text[3:]
+    if clean_json_text.endswith('```'):
+        clean_json_text = clean_json_text[:-3]
+
+    return clean_json_text.strip()
+
 def _create_fallback_recommendation() -> ContentRecommendation:
     """Create a fallback recommendation when AI generation fails."""
     return ContentRecommendation(
@@ -1,43 +1,240 @@
 # api/services/transcriber.py
 
+import io
 import os
-import re
+import shutil
+import signal
+import asyncio
+import hashlib
 import logging
-import tempfile
-import subprocess
-from typing import Optional
+import functools
+from operator import itemgetter
+from xml.etree.ElementTree import ParseError
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
-from openai import OpenAI
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, VideoUnavailable
+from cachetools import TTLCache
+from openai import AsyncOpenAI
+from youtube_transcript_api import (
+    YouTubeTranscriptApi,
+    CouldNotRetrieveTranscript,
+    InvalidVideoId,
+    NoTranscriptFound,
+    TranscriptsDisabled,
+    VideoUnavailable,
+)
+
+from utils.cache import consume_exception, record_fallback, singleflight
+from utils.youtube import extract_video_id
 
 logger = logging.getLogger(__name__)
 
+# Bahasa caption resmi yang dicoba di lapis 1, sesuai urutan prioritas
+CAPTION_LANGUAGES = ('en', 'id', 'en-US', 'en-GB')
+
+# Cache di memori proses: caption per (video_id, bahasa), transkrip akhir per video_id,
+# dan hasil Whisper per hash audio (audio yang sama tidak perlu ditranskripsi ulang)
+_CAPTIONS_CACHE = TTLCache(maxsize=1024, ttl=86400)
+_TRANSCRIPT_CACHE = TTLCache(maxsize=1024, ttl=86400)
+_WHISPER_CACHE = TTLCache(maxsize=256, ttl=7 * 86400)
+
+# Future per video_id yang sedang diproses: permintaan bersamaan untuk video yang sama
+# menunggu hasil (atau error) permintaan pertama alih-alih mengunduh/mentranskripsi ulang
+_TRANSCRIPT_INFLIGHT: Dict[str, asyncio.Future] = {}
+
+# Audio panjang dipecah per segmen dan ditranskripsi paralel oleh Whisper.
+# Audio hasil _download_audio berbitrate 64 kbps (8000 byte/detik).
+WHISPER_SEGMENT_SECONDS = 300
+_AUDIO_BYTES_PER_SECOND = 8000
+
+# Bitrate (kbps) dan sample rate (Hz) frame MP3 Layer III, per versi MPEG di header frame
+# (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5), untuk mencari batas frame saat memecah audio
+_MP3_BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    0: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_WHISPER_SEM = asyncio.Semaphore(int(os.getenv("WHISPER_MAX_INFLIGHT", "4")))
+
+# Batas unduhan yt-dlp | ffmpeg yang berjalan bersamaan (termasuk prefetch), agar lonjakan
+# request yang jatuh ke fallback tidak memunculkan puluhan proses sekaligus
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "4"))
+_DOWNLOAD_SEM = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+
+# Ambil teks dari satu potongan caption youtube_transcript_api ({'text', 'start', 'duration'})
+_caption_text = itemgetter('text')
+
+# Batas waktu lapis 1 (caption resmi); jika terlewati, langsung lanjut ke lapis berikutnya
+CAPTION_TIMEOUT = 5.0
+
+# Error caption yang berarti "coba lapis berikutnya". Video yang tidak tersedia
+# (privat/dihapus) tidak termasuk, karena lapis lain pasti gagal dengan alasan yang sama.
+_CAPTION_ERRORS = (CouldNotRetrieveTranscript, ParseError, OSError, asyncio.TimeoutError)
+
+# Unduhan audio spekulatif dimulai saat caption belum juga didapat setelah sekian detik
+AUDIO_PREFETCH_DELAY = float(os.getenv("AUDIO_PREFETCH_DELAY", "1.5"))
+
+# Program eksternal yang dibutuhkan fallback Whisper
+AUDIO_TOOLS = ("yt-dlp", "ffmpeg")
+
+# Setelah proses pipeline dimatikan, batas waktu menunggu pipe-nya tertutup. Proses yang lolos dari
+# process group tetapi masih memegang stdout/stderr tidak boleh menahan timeout pipeline
+_PIPE_DRAIN_TIMEOUT = 2.0
+
 class VideoProcessingError(Exception):
     """Exception khusus untuk kegagalan pemrosesan video yang spesifik."""
     pass
 
+@functools.lru_cache(maxsize=None)
+def _have_command(cmd: str) -> bool:
+    """Cek apakah program ada di PATH (sekali per proses, tanpa menjalankan programnya)."""
+    return shutil.which(cmd) is not None
+
+def _as_upload(audio_bytes: bytes) -> io.BytesIO:
+    """Bungkus audio di memori sebagai file MP3 untuk diunggah ke Whisper."""
+    buffer = io.BytesIO(audio_bytes)
+    buffer.name = "audio.mp3"
+    return buffer
+
+def _mp3_frame_length(header: bytes) -> int:
+    """Panjang frame MP3 Layer III yang diawali `header` (4 byte), atau 0 jika bukan header frame yang valid."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return 0
+    version = (header[1] >> 3) & 3
+    layer = (header[1] >> 1) & 3
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return 0
+    padding = (header[2] >> 1) & 1
+    samples_per_frame = 1152 if version == 3 else 576
+    bitrate = _MP3_BITRATES[version][bitrate_index] * 1000
+    return samples_per_frame // 8 * bitrate // _MP3_SAMPLE_RATES[version][sample_rate_index] + padding
+
+def _next_mp3_frame(audio_bytes: bytes, start: int) -> Optional[int]:
+    """Offset frame MP3 pertama mulai dari `start` yang langsung disusul frame berikutnya, atau None."""
+    pos = audio_bytes.find(b"\xff", start)
+    while pos != -1:
+        length = _mp3_frame_length(audio_bytes[pos:pos + 4])
+        # Dua header berurutan memastikan byte 0xFF ini bukan kebetulan di dalam data audio
+        if length and _mp3_frame_length(audio_bytes[pos + length:pos + length + 4]):
+            return pos
+        pos = audio_bytes.find(b"\xff", pos + 1)
+    return None
+
+def _split_audio(audio_bytes: bytes) -> List[bytes]:
+    """
+    Memecah audio MP3 menjadi segmen ~WHISPER_SEGMENT_SECONDS detik tanpa re-encode.
+
+    Audio dari _download_audio berbitrate tetap, jadi posisi potong dihitung dari jumlah byte
+    lalu digeser ke awal frame MP3 berikutnya; tidak perlu menjalankan ffmpeg per segmen.
+    """
+    segment_bytes = WHISPER_SEGMENT_SECONDS * _AUDIO_BYTES_PER_SECOND
+    cuts = [0]
+    for target in range(segment_bytes, len(audio_bytes), segment_bytes):
+        cut = _next_mp3_frame(audio_bytes, max(target, cuts[-1] + 1))
+        if cut is None:
+            break
+        cuts.append(cut)
+    cuts.append(len(audio_bytes))
+    return [audio_bytes[start:end] for start, end in zip(cuts, cuts[1:]) if end > start]
+
+def _missing_audio_tools() -> List[str]:
+    """Daftar program fallback Whisper yang tidak terpasang."""
+    return [cmd for cmd in AUDIO_TOOLS if not _have_command(cmd)]
+
+async def _run_pipeline(commands: List[list], timeout: float) -> Tuple[bytes, List[Tuple[int, str]]]:
+    """
+    Jalankan perintah eksternal yang dirangkai lewat pipe (seperti `a | b`) tanpa memblokir event loop.
+
+    Mengembalikan (stdout perintah terakhir, [(returncode, stderr) tiap perintah]).
+    Setiap perintah berjalan di process group sendiri, sehingga jika melewati `timeout` detik atau
+    coroutine dibatalkan, proses beserta turunannya (mis. ffmpeg yang dijalankan yt-dlp) ikut dimatikan.
+    """
+    procs = []
+    parent_fds = []
+    try:
+        stdin = asyncio.subprocess.DEVNULL
+        for i, cmd in enumerate(commands):
+            if i < len(commands) - 1:
+                next_stdin, stdout = os.pipe()
+                parent_fds.extend((next_stdin, stdout))
+            else:
+                next_stdin, stdout = None, asyncio.subprocess.PIPE
+            procs.append(await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=stdin,
+                stdout=stdout,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+            ))
+            stdin = next_stdin
+    except BaseException:
+        await _kill_processes(procs)
+        raise
+    finally:
+        # Proses anak sudah mewarisi ujung pipe-nya; tutup salinan milik parent
+        for fd in parent_fds:
+            os.close(fd)
+
+    communication = asyncio.gather(*(proc.communicate() for proc in procs))
+    try:
+        done, _ = await asyncio.wait({communication}, timeout=timeout)
+    finally:
+        # Saat timeout atau dibatalkan: matikan proses dulu, lalu beri communicate() waktu singkat
+        # untuk selesai dan ambil hasilnya agar tidak muncul warning 'exception was never retrieved'
+        await _kill_processes(procs)
+        await asyncio.wait({communication}, timeout=_PIPE_DRAIN_TIMEOUT)
+        if not communication.done():
+            communication.cancel()
+            await asyncio.wait({communication})
+        consume_exception(communication)
+    if not done:
+        raise VideoProcessingError(f"'{commands[0][0]}' timed out after {timeout:g} seconds.")
+
+    results = communication.result()
+    return results[-1][0], [(proc.returncode, stderr.decode(errors="replace")) for proc, (_, stderr) in zip(procs, results)]
+
+async def _kill_processes(procs: list) -> None:
+    """Matikan proses yang masih berjalan beserta process group-nya, lalu tunggu hingga selesai."""
+    for proc in procs:
+        if proc.returncode is None:
+            try:
+                # start_new_session=True: PID proses sekaligus ID process group-nya
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            # wait() baru selesai setelah pipe proses tertutup, jadi dibatasi seperti communicate()
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=_PIPE_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Process {proc.pid} was killed but its pipes are still held open by another process.")
+
 class TranscriberService:
     def __init__(self):
         """Inisialisasi service dan client OpenAI."""
         openai_api_key = os.getenv("OPENAI_API_KEY")
         if openai_api_key:
-            self.openai_client = OpenAI(api_key=openai_api_key, timeout=120.0)
+            self.openai_client = AsyncOpenAI(api_key=openai_api_key, timeout=120.0)
             logger.info("OpenAI client initialized.")
         else:
             self.openai_client = None
             logger.warning("OPENAI_API_KEY not found. Whisper transcription will not be available.")
         
         self.cookies_path = os.getenv("YOUTUBE_COOKIES_PATH", "./cookies.txt")
+        # Unduh audio secara spekulatif selagi caption dicoba (lihat start_audio_prefetch)
+        self.audio_prefetch_enabled = os.getenv("AUDIO_PREFETCH", "true").lower() == "true"
 
-    def _extract_video_id(self, url: str) -> Optional[str]:
-        """Mengekstrak ID video dari URL YouTube."""
-        patterns = [r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)']
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1).split('&')[0]
-        return None
+    def cache_clear(self) -> None:
+        """
+        Kosongkan semua cache transkrip, misalnya sebelum transkripsi ulang secara manual.
+
+        Analisis yang sudah di-cache router tidak ikut terhapus; gunakan clear_cached_analysis di routers.analyze.
+        """
+        _CAPTIONS_CACHE.clear()
+        _TRANSCRIPT_CACHE.clear()
+        _WHISPER_CACHE.clear()
 
     async def get_transcript(self, youtube_url: str) -> str:
         """
@@ -45,49 +242,91 @@ class TranscriberService:
         1. Coba ambil teks/caption resmi (metode tercepat).
         2. Coba ambil auto-generated captions
         3. Jika gagal, unduh audio dengan yt-dlp (metode paling andal) dan transkripsi.
+
+        Unduhan audio untuk lapis 3 dimulai secara spekulatif bila caption belum didapat
+        setelah AUDIO_PREFETCH_DELAY detik, dan dibatalkan jika lapis 1 atau 2 berhasil.
         """
-        video_id = self._extract_video_id(youtube_url)
+        video_id = extract_video_id(youtube_url)
         if not video_id:
             raise ValueError("Invalid YouTube URL format.")
-            
+
         logger.info(f"Processing video ID: {video_id}")
 
+        cached_transcript = _TRANSCRIPT_CACHE.get(video_id)
+        if cached_transcript is not None:
+            logger.info(f"Using cached transcript for video ID: {video_id}")
+            return cached_transcript
+
+        if video_id in _TRANSCRIPT_INFLIGHT:
+            logger.info(f"Waiting for in-flight transcript of video ID: {video_id}")
+        transcript_text, is_mock = await singleflight(
+            _TRANSCRIPT_INFLIGHT, video_id, functools.partial(self._load_transcript, youtube_url, video_id)
+        )
+        if is_mock:
+            record_fallback("transcript")
+        return transcript_text
+
+    async def _load_transcript(self, youtube_url: str, video_id: str) -> Tuple[str, bool]:
+        """
+        Jalankan ketiga lapis untuk satu video; hasilnya dibagi ke semua pemanggil yang menunggu.
+
+        Mengembalikan (transkrip, True jika transkrip mock).
+        """
+        logger.info("Layer 1: Attempting to fetch official transcript.")
+        # CAPTION_TIMEOUT dihitung sejak caption mulai diambil, termasuk jeda _delayed_audio_prefetch
+        caption_deadline = asyncio.get_running_loop().time() + CAPTION_TIMEOUT
+        caption_task = asyncio.create_task(self._cached_get_captions(video_id, CAPTION_LANGUAGES))
+        caption_task.add_done_callback(consume_exception)
+        audio_prefetch = None
+        try:
+            audio_prefetch = await self._delayed_audio_prefetch(youtube_url, caption_task)
+            return await self._get_transcript(youtube_url, video_id, caption_task, caption_deadline, audio_prefetch)
+        finally:
+            caption_task.cancel()
+            if audio_prefetch is not None and not audio_prefetch.done():
+                logger.info("Transcript obtained without audio; cancelling audio prefetch.")
+                audio_prefetch.cancel()
+
+    async def _delayed_audio_prefetch(self, youtube_url: str, caption_task: asyncio.Task) -> Optional[asyncio.Task]:
+        """Mulai prefetch audio hanya jika caption belum selesai dalam AUDIO_PREFETCH_DELAY detik."""
+        if not self._can_prefetch_audio():
+            return None
+        done, _ = await asyncio.wait({caption_task}, timeout=AUDIO_PREFETCH_DELAY)
+        if done:
+            return None
+        logger.info(f"Captions not ready after {AUDIO_PREFETCH_DELAY:g}s; starting speculative audio download.")
+        return self.start_audio_prefetch(youtube_url)
+
+    async def _get_transcript(
+        self,
+        youtube_url: str,
+        video_id: str,
+        caption_task: asyncio.Task,
+        caption_deadline: float,
+        audio_prefetch: Optional[asyncio.Task]
+    ) -> Tuple[str, bool]:
         # --- LAPISAN 1: Coba Ambil Teks Resmi ---
         try:
-            logger.info("Layer 1: Attempting to fetch official transcript.")
-            # Try multiple language codes
-            language_codes = ['en', 'id', 'en-US', 'en-GB']
-            transcript_list = None
-            
-            for lang in language_codes:
-                try:
-                    transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=[lang])
-                    break
-                except Exception:
-                    continue
-            
-            if transcript_list:
-                transcript_text = " ".join(item.get('text', '') for item in transcript_list)
-                if len(transcript_text.strip()) > 20:
-                    logger.info("Layer 1 Succeeded: Found official transcript.")
-                    return transcript_text.strip()
-        except Exception as e:
+            remaining = max(0.0, caption_deadline - asyncio.get_running_loop().time())
+            transcript_text = await asyncio.wait_for(caption_task, timeout=remaining)
+            if transcript_text:
+                logger.info("Layer 1 Succeeded: Found official transcript.")
+                return self._remember_transcript(video_id, transcript_text), False
+        except (VideoUnavailable, InvalidVideoId) as e:
+            self._raise_unavailable(video_id, e)
+        except _CAPTION_ERRORS as e:
             logger.warning(f"Layer 1 Failed: Could not fetch official transcript ({type(e).__name__}).")
 
         # --- LAPISAN 2: Coba Auto-Generated Captions ---
         try:
             logger.info("Layer 2: Attempting to fetch auto-generated captions.")
-            transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-            
-            # Try to find auto-generated transcripts
-            for transcript in transcript_list:
-                if transcript.is_generated:
-                    transcript_data = transcript.fetch()
-                    transcript_text = " ".join(item.get('text', '') for item in transcript_data)
-                    if len(transcript_text.strip()) > 20:
-                        logger.info("Layer 2 Succeeded: Found auto-generated captions.")
-                        return transcript_text.strip()
-        except Exception as e:
+            transcript_text = await asyncio.to_thread(self._fetch_generated_captions, video_id)
+            if transcript_text:
+                logger.info("Layer 2 Succeeded: Found auto-generated captions.")
+                return self._remember_transcript(video_id, transcript_text), False
+        except (VideoUnavailable, InvalidVideoId) as e:
+            self._raise_unavailable(video_id, e)
+        except _CAPTION_ERRORS as e:
             logger.warning(f"Layer 2 Failed: Could not fetch auto-generated captions ({type(e).__name__}).")
 
         # --- LAPISAN 3: Fallback ke Mock Data atau Error ---
@@ -97,15 +336,71 @@ class TranscriberService:
         if not self.openai_client:
             # Return a mock transcript for development/testing
             logger.warning("OpenAI not available. Returning mock transcript for development.")
-            return self._generate_mock_transcript(youtube_url)
+            return self._generate_mock_transcript(youtube_url), True
         
         # Try audio download and transcription as last resort
         try:
-            return await self._download_and_transcribe_with_yt_dlp(youtube_url)
+            transcript_text = await self._download_and_transcribe_with_yt_dlp(youtube_url, audio_prefetch)
+            return self._remember_transcript(video_id, transcript_text), False
         except Exception as e:
             logger.error(f"Audio transcription failed: {e}")
             # Return mock transcript as final fallback
-            return self._generate_mock_transcript(youtube_url)
+            return self._generate_mock_transcript(youtube_url), True
+
+    def _raise_unavailable(self, video_id: str, error: Exception) -> None:
+        """Hentikan proses lebih awal: video yang tidak tersedia tidak perlu dicoba diunduh."""
+        logger.error(f"Video {video_id} is unavailable ({type(error).__name__}); skipping audio fallback.")
+        raise VideoProcessingError("This video is unavailable (it may be private, deleted, or region-restricted).")
+
+    async def _cached_get_captions(self, video_id: str, languages: tuple) -> Optional[str]:
+        """Ambil caption resmi pertama yang tersedia dari `languages`, dengan cache per (video_id, languages)."""
+        cache_key = (video_id, languages)
+        cached = _CAPTIONS_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # youtube_transcript_api bersifat blocking; jalankan di thread agar event loop tetap bebas
+        transcript_text = await asyncio.to_thread(self._fetch_captions, video_id, languages)
+        if transcript_text:
+            _CAPTIONS_CACHE[cache_key] = transcript_text
+        return transcript_text
+
+    def _fetch_captions(self, video_id: str, languages: tuple) -> Optional[str]:
+        """Ambil caption resmi pertama yang tersedia dari `languages` (blocking)."""
+        transcript_list = None
+        for lang in languages:
+            try:
+                transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=[lang])
+                break
+            except NoTranscriptFound:
+                continue
+            except TranscriptsDisabled:
+                # Caption dimatikan untuk semua bahasa; bahasa lain tidak perlu dicoba
+                return None
+
+        if transcript_list:
+            transcript_text = " ".join(filter(None, map(_caption_text, transcript_list))).strip()
+            if len(transcript_text) > 20:
+                return transcript_text
+        return None
+
+    def _fetch_generated_captions(self, video_id: str) -> Optional[str]:
+        """Ambil auto-generated caption pertama yang cukup panjang (blocking)."""
+        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
+
+        # Try to find auto-generated transcripts
+        for transcript in transcript_list:
+            if transcript.is_generated:
+                transcript_data = transcript.fetch()
+                transcript_text = " ".join(filter(None, map(_caption_text, transcript_data))).strip()
+                if len(transcript_text) > 20:
+                    return transcript_text
+        return None
+
+    def _remember_transcript(self, video_id: str, transcript_text: str) -> str:
+        """Simpan transkrip akhir ke cache dan kembalikan transkrip tersebut."""
+        _TRANSCRIPT_CACHE[video_id] = transcript_text
+        return transcript_text
 
     def _generate_mock_transcript(self, youtube_url: str) -> str:
         """Generate a mock transcript for development purposes."""
@@ -127,60 +422,128 @@ class TranscriberService:
         and anyone interested in the intersection of technology and innovation.
         """
 
-    async def _download_and_transcribe_with_yt_dlp(self, youtube_url: str) -> str:
-        """Mengunduh audio menggunakan yt-dlp dan mentranskripsikannya dengan Whisper."""
+    def start_audio_prefetch(self, youtube_url: str) -> Optional[asyncio.Task]:
+        """
+        Mulai mengunduh audio di background untuk fallback Whisper (spekulatif).
+
+        Dipanggil oleh get_transcript setelah cek cache, dan dibatalkan jika caption
+        berhasil diambil. Mengembalikan None jika Whisper tidak tersedia
+        atau prefetch dimatikan lewat AUDIO_PREFETCH=false,
+        atau yt-dlp/ffmpeg tidak terpasang.
+        """
+        if not self._can_prefetch_audio():
+            return None
+        task = asyncio.create_task(self._download_audio(youtube_url))
+        # Hindari warning 'exception never retrieved' jika hasil prefetch tidak pernah dipakai
+        task.add_done_callback(consume_exception)
+        return task
+
+    def _can_prefetch_audio(self) -> bool:
+        """Prefetch audio hanya berguna jika Whisper, AUDIO_PREFETCH, dan yt-dlp/ffmpeg tersedia."""
+        return bool(self.openai_client) and self.audio_prefetch_enabled and not _missing_audio_tools()
+
+    async def _download_and_transcribe_with_yt_dlp(
+        self,
+        youtube_url: str,
+        audio_prefetch: Optional[asyncio.Task] = None
+    ) -> str:
+        """Mengunduh audio menggunakan yt-dlp (atau memakai hasil prefetch) dan mentranskripsikannya dengan Whisper."""
         if not self.openai_client:
             raise VideoProcessingError("Cannot transcribe audio: OpenAI API key is not configured.")
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            output_template = temp_path / "audio"
-            
-            cmd = [
-                "yt-dlp",
-                "--extract-audio",
-                "--audio-format", "mp3",
-                "--no-playlist",
-                "--output", f"{output_template}.%(ext)s"
-            ]
-
-            # Logika krusial untuk menggunakan cookies
-            if Path(self.cookies_path).exists():
-                logger.info(f"Using cookies file found at: {self.cookies_path}")
-                cmd.extend(["--cookies", self.cookies_path])
+        try:
+            if audio_prefetch is not None:
+                logger.info("Layer 3: Using prefetched audio download.")
+                audio_bytes = await audio_prefetch
             else:
-                logger.warning(f"Cookies file not found at '{self.cookies_path}'. Download may be blocked by YouTube.")
+                audio_bytes = await self._download_audio(youtube_url)
 
-            cmd.append(youtube_url)
-            
-            try:
-                logger.info("Layer 3: Attempting audio download with yt-dlp.")
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=300, check=False)
-
-                # Analisis hasil dari yt-dlp
-                if result.returncode != 0:
-                    stderr = result.stderr.lower()
-                    # Memberikan pesan eror yang spesifik dan solutif
-                    if "sign in to confirm" in stderr or "confirm you're not a bot" in stderr or "403" in stderr:
-                        logger.error("yt-dlp failed due to bot detection.")
-                        raise VideoProcessingError("YouTube blocked the download, suspecting automation. Please generate a fresh 'cookies.txt' file and place it in the 'api' directory.")
-                    else:
-                        logger.error(f"yt-dlp failed with an unknown error. Stderr: {result.stderr}")
-                        raise VideoProcessingError(f"Failed to download audio. yt-dlp error: {result.stderr[:200]}")
-
-                audio_path = Path(f"{output_template}.mp3")
-                if not audio_path.exists():
-                    raise FileNotFoundError("Audio file was not created by yt-dlp despite a successful run.")
-                
-                # Proses Transkripsi
-                logger.info(f"Audio downloaded successfully. Transcribing file: {audio_path}")
-                with open(audio_path, "rb") as audio_file:
-                    transcription = self.openai_client.audio.transcriptions.create(model="whisper-1", file=audio_file)
-                
-                return transcription.text.strip()
-
-            except Exception as e:
-                if isinstance(e, VideoProcessingError):
-                    raise e # Lemparkan lagi eror yang sudah kita buat
-                logger.error(f"An unexpected error occurred during yt-dlp processing: {e}", exc_info=True)
-                raise VideoProcessingError("An unexpected error occurred while trying to download and transcribe the video.")
\ No newline at end of file
+            audio_hash = hashlib.sha256(audio_bytes).hexdigest()
+            cached = _WHISPER_CACHE.get(audio_hash)
+            if cached is not None:
+                logger.info("Using cached Whisper transcription for identical audio.")
+                return cached
+
+            # Proses Transkripsi: segmen ditranskripsi paralel lalu digabung sesuai urutan
+            segments = _split_audio(audio_bytes)
+            logger.info(f"Audio downloaded successfully ({len(audio_bytes)} bytes). Transcribing {len(segments)} segment(s) with Whisper.")
+            results = await asyncio.gather(*(self._transcribe_segment(segment) for segment in segments))
+            transcript_text = " ".join(text for text in results if text)
+            _WHISPER_CACHE[audio_hash] = transcript_text
+            return transcript_text
+
+        except Exception as e:
+            if isinstance(e, VideoProcessingError):
+                raise e # Lemparkan lagi eror yang sudah kita buat
+            logger.error(f"An unexpected error occurred during yt-dlp processing: {e}", exc_info=True)
+            raise VideoProcessingError("An unexpected error occurred while trying to download and transcribe the video.")
+
+    async def _transcribe_segment(self, segment: bytes) -> str:
+        """Transkripsi satu segmen audio dengan Whisper, dibatasi oleh _WHISPER_SEM."""
+        async with _WHISPER_SEM:
+            transcription = await self.openai_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=_as_upload(segment),
+                response_format="text"
+            )
+        # Dengan response_format="text" API mengembalikan teks mentah, bukan objek JSON
+        return transcription.strip()
+
+    async def _download_audio(self, youtube_url: str) -> bytes:
+        """
+        Mengunduh audio dengan yt-dlp dan langsung mengubahnya dengan ffmpeg menjadi
+        MP3 mono 16 kHz, tanpa file perantara di disk.
+        """
+        missing = _missing_audio_tools()
+        if missing:
+            logger.error(f"Audio fallback unavailable, missing tools: {', '.join(missing)}")
+            raise VideoProcessingError(f"Cannot download audio: {' and '.join(missing)} not installed on the server.")
+
+        ytdlp_cmd = [
+            "yt-dlp",
+            # Whisper hanya butuh audio mono 16 kHz; cukup unduh stream audio berbitrate rendah
+            "-f", "bestaudio[abr<=64]/worstaudio/best",
+            "--no-playlist",
+            "--no-progress",
+            "--output", "-"
+        ]
+
+        # Logika krusial untuk menggunakan cookies
+        if Path(self.cookies_path).exists():
+            logger.info(f"Using cookies file found at: {self.cookies_path}")
+            ytdlp_cmd.extend(["--cookies", self.cookies_path])
+        else:
+            logger.warning(f"Cookies file not found at '{self.cookies_path}'. Download may be blocked by YouTube.")
+
+        ytdlp_cmd.append(youtube_url)
+
+        ffmpeg_cmd = [
+            "ffmpeg",
+            "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-vn", "-ac", "1", "-ar", "16000", "-b:a", "64k",
+            "-f", "mp3", "pipe:1"
+        ]
+
+        logger.info("Layer 3: Attempting audio download with yt-dlp | ffmpeg.")
+        async with _DOWNLOAD_SEM:
+            audio_bytes, [(ytdlp_code, ytdlp_stderr), (ffmpeg_code, ffmpeg_stderr)] = await _run_pipeline(
+                [ytdlp_cmd, ffmpeg_cmd], timeout=300
+            )
+
+        # Analisis hasil dari yt-dlp
+        if ytdlp_code != 0:
+            stderr = ytdlp_stderr.lower()
+            # Memberikan pesan eror yang spesifik dan solutif
+            if "sign in to confirm" in stderr or "confirm you're not a bot" in stderr or "403" in stderr:
+                logger.error("yt-dlp failed due to bot detection.")
+                raise VideoProcessingError("YouTube blocked the download, suspecting automation. Please generate a fresh 'cookies.txt' file and place it in the 'api' directory.")
+            else:
+                logger.error(f"yt-dlp failed with an unknown error. Stderr: {ytdlp_stderr}")
+                raise VideoProcessingError(f"Failed to download audio. yt-dlp error: {ytdlp_stderr[:200]}")
+
+        if ffmpeg_code != 0 or not audio_bytes:
+            logger.error(f"ffmpeg failed to convert the downloaded audio. Stderr: {ffmpeg_stderr}")
+            raise VideoProcessingError(f"Failed to convert audio. ffmpeg error: {ffmpeg_stderr[:200]}")
+
+        return audio_bytes
@@ -3,6 +3,17 @@ from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# Score threshold -> label, ordered from the highest threshold
+VIRAL_LABELS = (
+    (80, "Very High Potential"),
+    (60, "Good Potential"),
+    (0, "Needs Improvement"),
+)
+
+def get_viral_label(score: int) -> str:
+    """Return the viral label for a 0-100 score based on VIRAL_LABELS."""
+    return next((label for threshold, label in VIRAL_LABELS if score >= threshold), VIRAL_LABELS[-1][1])
+
 class ViralAnalysisService:
     """
     Service for analyzing viral potential of content.
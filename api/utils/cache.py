@@ -0,0 +1,196 @@
+# api/utils/cache.py
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, MutableMapping, Optional, Set, TypeVar
+
+from cachetools import TTLCache
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis bersifat opsional
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+def _create_redis_client():
+    """Membuat client Redis (dengan connection pool) jika REDIS_URL diatur."""
+    if not REDIS_URL:
+        return None
+    if aioredis is None:
+        logger.warning("REDIS_URL is set but the 'redis' package is not installed. Falling back to in-process cache.")
+        return None
+    logger.info("Redis cache enabled.")
+    return aioredis.from_url(REDIS_URL, decode_responses=True)
+
+redis_client = _create_redis_client()
+
+# Sumber fallback (mis. transkrip mock, ringkasan pengganti) yang dipakai selama satu analisis.
+# Set yang sama dibagi ke task turunan karena context disalin saat task dibuat
+_FALLBACKS: ContextVar[Optional[Set[str]]] = ContextVar("fallbacks", default=None)
+
+@contextmanager
+def track_fallbacks() -> Iterator[Set[str]]:
+    """Kumpulkan sumber fallback yang dicatat record_fallback selama blok `with` berjalan."""
+    fallbacks: Set[str] = set()
+    token = _FALLBACKS.set(fallbacks)
+    try:
+        yield fallbacks
+    finally:
+        _FALLBACKS.reset(token)
+
+def record_fallback(source: str) -> None:
+    """Catat bahwa hasil `source` memakai nilai fallback, agar hasil akhirnya tidak di-cache."""
+    fallbacks = _FALLBACKS.get()
+    if fallbacks is not None:
+        fallbacks.add(source)
+
+class ResponseCache:
+    """
+    Cache nilai string dengan TTL.
+
+    Memakai Redis jika tersedia sehingga cache dibagi antar worker,
+    dan memakai cache di memori proses jika Redis tidak dikonfigurasi atau gagal.
+    """
+
+    def __init__(self, ttl: int, maxsize: int = 1024):
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        if redis_client is not None:
+            try:
+                value = await redis_client.get(key)
+                if value is not None:
+                    return value
+            except Exception as e:
+                logger.warning(f"Redis GET failed for '{key}': {e}")
+        return self._local.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        if redis_client is not None:
+            try:
+                await redis_client.setex(key, self.ttl, value)
+                return
+            except Exception as e:
+                logger.warning(f"Redis SETEX failed for '{key}': {e}")
+        self._local[key] = value
+
+    async def delete(self, key: str) -> None:
+        if redis_client is not None:
+            try:
+                await redis_client.delete(key)
+            except Exception as e:
+                logger.warning(f"Redis DEL failed for '{key}': {e}")
+        self._local.pop(key, None)
+
+class TaskStore:
+    """
+    Menyimpan status background task sebagai kumpulan field.
+
+    Memakai Redis hash (`{prefix}{task_id}`) jika tersedia agar status bisa dibaca
+    oleh worker mana pun, dan dict di memori proses jika tidak.
+    Nilai field harus bisa di-serialize ke JSON.
+    """
+
+    def __init__(self, prefix: str, ttl: int = 86400, maxsize: int = 10000):
+        self.prefix = prefix
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def update(self, task_id: str, **fields: Any) -> None:
+        if redis_client is not None:
+            key = f"{self.prefix}{task_id}"
+            try:
+                await redis_client.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+                await redis_client.expire(key, self.ttl)
+                return
+            except Exception as e:
+                logger.warning(f"Redis HSET failed for '{key}': {e}")
+        task = self._local.get(task_id, {})
+        task.update(fields)
+        self._local[task_id] = task
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        if redis_client is not None:
+            key = f"{self.prefix}{task_id}"
+            try:
+                raw = await redis_client.hgetall(key)
+                if raw:
+                    return {name: json.loads(value) for name, value in raw.items()}
+            except Exception as e:
+                logger.warning(f"Redis HGETALL failed for '{key}': {e}")
+        task = self._local.get(task_id)
+        return dict(task) if task is not None else None
+
+def _make_key(args: tuple, kwargs: dict) -> str:
+    """Membuat hash yang stabil dari argumen pemanggilan."""
+    raw = repr((args, sorted(kwargs.items()))).encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def consume_exception(future: asyncio.Future) -> None:
+    """Done-callback untuk future yang hasilnya mungkin tidak pernah dibaca, agar tidak muncul warning 'exception was never retrieved'."""
+    if not future.cancelled():
+        future.exception()
+
+async def singleflight(
+    futures: MutableMapping[Hashable, asyncio.Future],
+    key: Hashable,
+    factory: Callable[[], Awaitable[T]],
+    keep_result: bool = False
+) -> T:
+    """
+    Jalankan `factory()` sekali per `key`; pemanggil bersamaan menunggu future yang sama di `futures`.
+
+    Future dihapus dari `futures` setelah selesai, sehingga pemanggilan berikutnya berjalan ulang.
+    Dengan `keep_result=True` hanya future yang gagal yang dihapus, dan `futures` (mis. TTLCache)
+    sekaligus menjadi cache hasil.
+    """
+    future = futures.get(key)
+    if future is None:
+        future = asyncio.ensure_future(factory())
+        futures[key] = future
+        future.add_done_callback(functools.partial(_forget_future, futures, key, keep_result))
+    # shield agar pembatalan satu pemanggil tidak membatalkan pemanggil lain
+    return await asyncio.shield(future)
+
+def _forget_future(
+    futures: MutableMapping[Hashable, asyncio.Future],
+    key: Hashable,
+    keep_result: bool,
+    future: asyncio.Future
+) -> None:
+    """Hapus future yang sudah selesai dari `futures`; jika `keep_result`, hanya yang gagal agar error tidak ikut disimpan."""
+    failed = future.cancelled() or future.exception() is not None
+    if (failed or not keep_result) and futures.get(key) is future:
+        futures.pop(key, None)
+
+def async_cache(ttl: int = 3600, maxsize: int = 10000):
+    """
+    Decorator memoization untuk coroutine function berdasarkan hash argumen.
+
+    Yang disimpan adalah future, bukan hasil, sehingga pemanggilan bersamaan
+    dengan argumen yang sama berbagi satu request yang sedang berjalan.
+    """
+    def decorator(func):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await singleflight(
+                cache, _make_key(args, kwargs), functools.partial(func, *args, **kwargs), keep_result=True
+            )
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
@@ -1,73 +1,451 @@
 # api/utils/youtube.py
 
 import httpx
+import orjson
+import asyncio
+import functools
 import re
 import logging
-from typing import Optional
+import math
+from typing import Dict, List, Optional
+from cachetools import TTLCache
+from tenacity import AsyncRetrying, retry_if_exception, wait_exponential_jitter
 from models.schemas import VideoMetadata
-from datetime import datetime
+from utils.cache import redis_client, singleflight
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
 import os
+import string
+import time
+
+try:
+    import h2  # noqa: F401  (dipakai httpx untuk HTTP/2)
+except ImportError:  # HTTP/2 bersifat opsional, jatuh ke HTTP/1.1
+    h2 = None
 
 logger = logging.getLogger(__name__)
 
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 BASE_URL = "https://www.googleapis.com/youtube/v3"
 
+# Pola regex dikompilasi sekali saat import; _VIDEO_ID_RE hanya fallback untuk input tanpa skema
+# (lihat extract_video_id). Pola dicocokkan dari awal input (host YouTube, boleh dengan subdomain)
+# dan ID harus diikuti akhir string atau salah satu _ID_TERMINATORS
+_VIDEO_ID_RE = re.compile(r'(?:[\w-]+\.)*(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:[^&#]*&)*v=|embed/|shorts/|live/|v/|e/)|youtu\.be/)([A-Za-z0-9_-]{11})(?=[?&#/]|$)')
+
+# Nilai detik untuk tiap satuan durasi ISO 8601 yang dipakai YouTube (mis. "PT1H2M3S", "P1DT2H")
+_DURATION_UNITS = {"D": 86400, "H": 3600, "M": 60, "S": 1}
+
+# Host YouTube yang dikenali dan awalan path yang diikuti ID video
+_YOUTUBE_HOSTS = ("youtube.com", "youtube-nocookie.com")
+_ID_PATH_PREFIXES = ("/embed/", "/shorts/", "/live/", "/v/", "/e/")
+
+# Bentuk URL paling umum (setelah skema dan www./m. dibuang) dicek dengan operasi string
+# biasa sebelum urlsplit/regex; ID harus diikuti akhir string atau salah satu _ID_TERMINATORS
+_FAST_PREFIXES = ("youtu.be/", "youtube.com/watch?v=", "youtube.com/shorts/")
+_ID_TERMINATORS = "?&#/"
+_NON_ID_CHARS = str.maketrans("", "", string.ascii_letters + string.digits + "-_")
+
+# Jumlah ID maksimum per request videos.list
+YOUTUBE_BATCH_SIZE = 50
+
+# Hanya field yang dipakai _build_metadata yang diminta (partial response), agar payload lebih kecil
+_VIDEO_PARTS = "snippet,statistics,contentDetails"
+_VIDEO_FIELDS = (
+    "items(id,"
+    "snippet(title,channelTitle,publishedAt,description,thumbnails/high/url),"
+    "statistics(viewCount,likeCount),"
+    "contentDetails(duration))"
+)
+
+# Batas request YouTube Data API yang berjalan bersamaan
+YOUTUBE_MAX_INFLIGHT = int(os.getenv("YOUTUBE_MAX_INFLIGHT", "8"))
+_YOUTUBE_SEM = asyncio.Semaphore(YOUTUBE_MAX_INFLIGHT)
+
+# Cache metadata per video_id, plus future yang sedang berjalan per video_id (singleflight)
+# agar cache miss yang bersamaan untuk video yang sama hanya memicu satu panggilan API
+# dan pemanggil lain ikut menunggu hasilnya. Video yang tidak ditemukan
+# juga di-cache (lebih singkat) agar ID yang salah tidak terus menghabiskan kuota.
+YOUTUBE_METADATA_TTL = int(os.getenv("YOUTUBE_METADATA_TTL", "86400"))
+YOUTUBE_NOT_FOUND_TTL = int(os.getenv("YOUTUBE_NOT_FOUND_TTL", "600"))
+_METADATA_CACHE = TTLCache(maxsize=4096, ttl=YOUTUBE_METADATA_TTL)
+_NOT_FOUND_CACHE = TTLCache(maxsize=4096, ttl=YOUTUBE_NOT_FOUND_TTL)
+
+# Rate limit (429) berlaku untuk seluruh kunci API, bukan per video: setelah semua percobaan
+# ulang habis, semua request ke YouTube API ditahan hingga satu batas waktu global
+# (sesuai Retry-After, atau YOUTUBE_RATE_LIMIT_BACKOFF detik jika tidak ada)
+YOUTUBE_RATE_LIMIT_BACKOFF = int(os.getenv("YOUTUBE_RATE_LIMIT_BACKOFF", "60"))
+_rate_limited_until = 0.0
+
+# Respons 429 dan 5xx dicoba ulang dengan backoff eksponensial (atau sesuai Retry-After),
+# dengan total waktu tunggu paling lama YOUTUBE_RETRY_BUDGET detik karena pemanggil sedang menunggu
+YOUTUBE_RETRY_ATTEMPTS = 4
+YOUTUBE_RETRY_BUDGET = float(os.getenv("YOUTUBE_RETRY_BUDGET", "10"))
+_backoff = wait_exponential_jitter(initial=1, max=YOUTUBE_RETRY_BUDGET)
+_METADATA_INFLIGHT: Dict[str, asyncio.Future] = {}
+
+# Jika REDIS_URL diatur, metadata juga disimpan di Redis (L2) agar cache dibagi antar worker
+# dan tetap hangat setelah restart; _METADATA_CACHE tetap menjadi L1 di memori proses
+_REDIS_KEY_PREFIX = "yt:meta:"
+
+# Penanda hasil _fetch_from_youtube_api untuk "API menjawab, tapi video tidak ada",
+# dibedakan dari None (gagal sementara, tidak di-cache)
+_NOT_FOUND = object()
+
+# httpx.AsyncClient bersama (connection pool) untuk semua request ke YouTube API,
+# dibuat saat pertama dipakai dan ditutup oleh lifespan aplikasi (lihat main.py)
+YOUTUBE_MAX_CONNECTIONS = int(os.getenv("YOUTUBE_MAX_CONNECTIONS", "100"))
+YOUTUBE_MAX_KEEPALIVE = int(os.getenv("YOUTUBE_MAX_KEEPALIVE", "20"))
+_http_client: Optional[httpx.AsyncClient] = None
+
+class YouTubeRateLimited(Exception):
+    """YouTube API sedang membatasi request; coba lagi setelah `retry_after` detik."""
+    def __init__(self, retry_after: int):
+        super().__init__(f"YouTube API rate limit reached; retry after {retry_after} seconds.")
+        self.retry_after = retry_after
+
+def get_client() -> httpx.AsyncClient:
+    """Mengembalikan client HTTP bersama agar handshake TCP+TLS tidak diulang di setiap request."""
+    global _http_client
+    if _http_client is None:
+        # HTTP/2 (jika paket h2 terpasang) memultipleks request paralel di satu koneksi TLS
+        _http_client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            http2=h2 is not None,
+            timeout=10.0,
+            limits=httpx.Limits(
+                max_connections=YOUTUBE_MAX_CONNECTIONS,
+                max_keepalive_connections=YOUTUBE_MAX_KEEPALIVE,
+            ),
+        )
+    return _http_client
+
+async def close_client() -> None:
+    """Menutup client HTTP bersama beserta koneksi yang masih terbuka."""
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None:
+        await client.aclose()
+
+def _is_host(host: str, domain: str) -> bool:
+    """Cek apakah `host` adalah `domain` atau subdomainnya."""
+    return host == domain or host.endswith("." + domain)
+
+def _is_video_id(candidate: str) -> bool:
+    """Cek bentuk ID video: tepat 11 karakter [A-Za-z0-9_-]."""
+    return len(candidate) == 11 and not candidate.translate(_NON_ID_CHARS)
+
+def _fast_video_id(url: str) -> Optional[str]:
+    """Jalur cepat untuk URL kanonik seperti https://www.youtube.com/watch?v=ID dan https://youtu.be/ID."""
+    rest = url.partition("://")[2] or url
+    if rest.startswith("www."):
+        rest = rest[4:]
+    elif rest.startswith("m."):
+        rest = rest[2:]
+
+    for prefix in _FAST_PREFIXES:
+        if rest.startswith(prefix):
+            start = len(prefix)
+            candidate = rest[start:start + 11]
+            if _is_video_id(candidate) and rest[start + 11:start + 12] in _ID_TERMINATORS:
+                return candidate
+            return None
+    return None
+
 def extract_video_id(youtube_url: str) -> Optional[str]:
-    """Mengekstrak ID video dari URL YouTube."""
+    """
+    Mengekstrak ID video (11 karakter) dari URL YouTube.
+
+    Mendukung youtu.be, watch?v= (di posisi parameter mana pun), embed, shorts, live,
+    serta subdomain seperti m. / music. dan youtube-nocookie.com.
+    """
     if not isinstance(youtube_url, str):
         return None
-    
-    patterns = [
-        r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)',
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, youtube_url)
-        if match:
-            return match.group(1).split('&')[0]
-    return None
+
+    url = youtube_url.strip()
+    video_id = _fast_video_id(url)
+    if video_id:
+        return video_id
+
+    has_scheme = "//" in url
+    parts = urlsplit(url if has_scheme else "//" + url)
+    host = (parts.hostname or "").lower()
+
+    # Segmen path diambil utuh (bukan dipotong 11 karakter) agar ID yang lebih panjang ditolak
+    candidate = None
+    if _is_host(host, "youtu.be"):
+        candidate = parts.path[1:].partition("/")[0]
+    elif any(_is_host(host, domain) for domain in _YOUTUBE_HOSTS):
+        if parts.path.rstrip("/") == "/watch":
+            candidate = parse_qs(parts.query).get("v", [""])[0]
+        else:
+            for prefix in _ID_PATH_PREFIXES:
+                if parts.path.startswith(prefix):
+                    candidate = parts.path[len(prefix):].partition("/")[0]
+                    break
+    elif has_scheme:
+        # Host bukan YouTube: jangan cari pola YouTube di path atau query host lain
+        return None
+
+    if candidate and _is_video_id(candidate):
+        return candidate
+    if has_scheme:
+        return None
+
+    match = _VIDEO_ID_RE.match(url)
+    return match.group(1) if match else None
 
 def _parse_duration(duration_str: str) -> int:
-    """Mengurai durasi ISO 8601 menjadi detik."""
-    if not duration_str or not duration_str.startswith('PT'):
+    """Mengurai durasi ISO 8601 menjadi detik dengan satu kali pemindaian string."""
+    if not duration_str or duration_str[0] != "P":
         return 0
-    
-    duration_str = duration_str[2:]
+
     total_seconds = 0
-    time_matches = re.match(r'(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?', duration_str)
-    
-    if not time_matches:
-        return 0
-        
-    hours, minutes, seconds = time_matches.groups()
-    total_seconds += int(hours) * 3600 if hours else 0
-    total_seconds += int(minutes) * 60 if minutes else 0
-    total_seconds += int(seconds) if seconds else 0
+    value = 0
+    for ch in duration_str[1:]:
+        if "0" <= ch <= "9":
+            value = value * 10 + ord(ch) - 48
+        elif ch == "T":
+            continue
+        else:
+            unit = _DURATION_UNITS.get(ch)
+            if unit is None:
+                return 0
+            total_seconds += value * unit
+            value = 0
     return total_seconds
 
+def _parse_published_at(value: str) -> datetime:
+    """
+    Mengurai `publishedAt` YouTube (format tetap "YYYY-MM-DDTHH:MM:SSZ") langsung dari potongan string.
+
+    Bentuk lain (mis. dengan pecahan detik) diurai dengan fromisoformat.
+    """
+    if len(value) == 20 and value[19] == "Z":
+        return datetime(
+            int(value[0:4]), int(value[5:7]), int(value[8:10]),
+            int(value[11:13]), int(value[14:16]), int(value[17:19]),
+            tzinfo=timezone.utc,
+        )
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def _known_unavailable(video_id: str) -> bool:
+    """True jika video baru saja tidak ditemukan (lihat cache negatif)."""
+    return video_id in _NOT_FOUND_CACHE
+
+def _check_rate_limit() -> None:
+    """Lempar YouTubeRateLimited selama batas waktu rate limit global belum lewat."""
+    remaining = _rate_limited_until - time.monotonic()
+    if remaining > 0:
+        raise YouTubeRateLimited(math.ceil(remaining))
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Nilai header Retry-After (dalam detik) dari respons error, jika ada."""
+    if isinstance(error, httpx.HTTPStatusError):
+        retry_after = error.response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+    return None
+
+def _is_retryable(error: BaseException) -> bool:
+    """Hanya rate limit (429) dan error server (5xx) yang layak dicoba ulang."""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return False
+    status = error.response.status_code
+    return status == 429 or status >= 500
+
+def _retry_wait(retry_state) -> float:
+    """Ikuti header Retry-After jika ada, selain itu backoff eksponensial dengan jitter, dalam sisa YOUTUBE_RETRY_BUDGET."""
+    retry_after = _retry_after(retry_state.outcome.exception())
+    wait = _backoff(retry_state) if retry_after is None else retry_after
+    return min(wait, max(0.0, YOUTUBE_RETRY_BUDGET - retry_state.seconds_since_start))
+
+def _retry_stop(retry_state) -> bool:
+    """Berhenti setelah YOUTUBE_RETRY_ATTEMPTS percobaan, atau jika Retry-After melewati sisa YOUTUBE_RETRY_BUDGET."""
+    if retry_state.attempt_number >= YOUTUBE_RETRY_ATTEMPTS:
+        return True
+    remaining = YOUTUBE_RETRY_BUDGET - retry_state.seconds_since_start
+    retry_after = _retry_after(retry_state.outcome.exception())
+    return remaining <= 0 or (retry_after is not None and retry_after > remaining)
+
 async def get_video_metadata(youtube_url: str) -> Optional[VideoMetadata]:
-    """Mengambil metadata video dari YouTube API."""
+    """
+    Mengambil metadata video dari YouTube API, memakai cache jika tersedia.
+
+    Melempar YouTubeRateLimited jika metadata belum di-cache dan YouTube API sedang membatasi request.
+    """
     video_id = extract_video_id(youtube_url)
     if not video_id:
         logger.error(f"URL YouTube tidak valid: {youtube_url}")
         return None
 
+    cached = _METADATA_CACHE.get(video_id)
+    if cached is not None:
+        return cached
+    if _known_unavailable(video_id):
+        return None
+
+    return await singleflight(_METADATA_INFLIGHT, video_id, functools.partial(_load_metadata, video_id))
+
+async def _load_metadata(video_id: str) -> Optional[VideoMetadata]:
+    """Mengambil metadata dari Redis atau API lalu menyimpannya ke cache positif atau negatif."""
+    shared = await _shared_get([video_id])
+    if video_id in shared:
+        metadata = _METADATA_CACHE[video_id] = shared[video_id]
+        return metadata
+
+    metadata = await _fetch_from_youtube_api(video_id)
+    if metadata is _NOT_FOUND:
+        _NOT_FOUND_CACHE[video_id] = True
+        return None
+    if metadata is not None:
+        _METADATA_CACHE[video_id] = metadata
+        await _shared_set({video_id: metadata})
+    return metadata
+
+async def _shared_get(video_ids: List[str]) -> Dict[str, VideoMetadata]:
+    """Ambil metadata dari Redis (L2); kosong jika Redis tidak dikonfigurasi atau gagal."""
+    if redis_client is None or not video_ids:
+        return {}
+    try:
+        raw_values = await redis_client.mget([_REDIS_KEY_PREFIX + video_id for video_id in video_ids])
+    except Exception as e:
+        logger.warning(f"Redis MGET metadata gagal: {e}")
+        return {}
+
+    found = {}
+    for video_id, raw in zip(video_ids, raw_values):
+        if raw is None:
+            continue
+        try:
+            found[video_id] = VideoMetadata.model_validate_json(raw)
+        except ValueError as e:
+            logger.warning(f"Metadata di Redis untuk {video_id} tidak valid: {e}")
+    return found
+
+async def _shared_set(metadata_by_id: Dict[str, VideoMetadata]) -> None:
+    """Simpan metadata ke Redis (L2) dengan TTL yang sama seperti _METADATA_CACHE."""
+    if redis_client is None or not metadata_by_id:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for video_id, metadata in metadata_by_id.items():
+                pipe.setex(_REDIS_KEY_PREFIX + video_id, YOUTUBE_METADATA_TTL, metadata.model_dump_json())
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis SETEX metadata gagal: {e}")
+
+async def get_video_metadata_many(youtube_urls: List[str]) -> List[Optional[VideoMetadata]]:
+    """
+    Mengambil metadata banyak video sekaligus, dengan urutan hasil sesuai `youtube_urls`.
+
+    ID yang belum ada di cache (L1 atau Redis) diambil per YOUTUBE_BATCH_SIZE ID dalam satu request videos.list,
+    dan semua batch dikirim secara paralel.
+    URL yang tidak valid, video yang tidak ditemukan, atau batch yang gagal (termasuk karena rate limit) menghasilkan None.
+    """
+    video_ids = [extract_video_id(url) for url in youtube_urls]
+
+    results: Dict[str, Optional[VideoMetadata]] = {}
+    missing = []
+    for video_id in dict.fromkeys(filter(None, video_ids)):
+        cached = _METADATA_CACHE.get(video_id)
+        if cached is not None:
+            results[video_id] = cached
+        elif _known_unavailable(video_id):
+            results[video_id] = None
+        else:
+            missing.append(video_id)
+
+    shared = await _shared_get(missing)
+    for video_id, metadata in shared.items():
+        _METADATA_CACHE[video_id] = metadata
+        results[video_id] = metadata
+    missing = [video_id for video_id in missing if video_id not in shared]
+
+    # Semua batch dikirim bersamaan; jumlah request yang benar-benar berjalan dibatasi _YOUTUBE_SEM
+    batches = [missing[start:start + YOUTUBE_BATCH_SIZE] for start in range(0, len(missing), YOUTUBE_BATCH_SIZE)]
+    responses = await asyncio.gather(*(_request_batch(batch) for batch in batches))
+
+    fetched: Dict[str, VideoMetadata] = {}
+    for batch, items in zip(batches, responses):
+        if items is None:
+            continue
+        for item in items:
+            metadata = _build_metadata(item)
+            _METADATA_CACHE[item["id"]] = metadata
+            results[item["id"]] = fetched[item["id"]] = metadata
+        for video_id in batch:
+            if video_id not in results:
+                _NOT_FOUND_CACHE[video_id] = True
+    await _shared_set(fetched)
+
+    return [results.get(video_id) if video_id else None for video_id in video_ids]
+
+async def _request_batch(video_ids: List[str]) -> Optional[list]:
+    """_request_videos untuk get_video_metadata_many: batch yang terkena rate limit menghasilkan None."""
+    try:
+        return await _request_videos(video_ids)
+    except YouTubeRateLimited:
+        return None
+
+async def _fetch_from_youtube_api(video_id: str):
+    """
+    Mengambil metadata satu video langsung dari YouTube Data API.
+
+    Mengembalikan VideoMetadata, _NOT_FOUND jika video tidak ada, atau None jika request gagal.
+    """
+    items = await _request_videos([video_id])
+    if items is None:
+        return None
+
+    if not items:
+        logger.warning(f"Tidak ada video yang ditemukan untuk ID: {video_id}")
+        return _NOT_FOUND
+
+    return _build_metadata(items[0])
+
+async def _request_videos(video_ids: List[str]) -> Optional[list]:
+    """
+    Memanggil videos.list untuk satu atau beberapa ID; mengembalikan `items`, atau None jika request gagal.
+
+    Melempar YouTubeRateLimited jika YouTube API masih membatasi request setelah percobaan ulang.
+    """
+    global _rate_limited_until
     if not YOUTUBE_API_KEY:
         logger.error("Variabel lingkungan YOUTUBE_API_KEY tidak diatur.")
         raise Exception("Kunci API YouTube tidak dikonfigurasi di server.")
+    _check_rate_limit()
 
-    api_url = f"{BASE_URL}/videos"
     params = {
-        "part": "snippet,statistics,contentDetails",
-        "id": video_id,
+        "part": _VIDEO_PARTS,
+        "fields": _VIDEO_FIELDS,
+        "id": ",".join(video_ids),
         "key": YOUTUBE_API_KEY
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+        async for attempt in AsyncRetrying(
+            retry=retry_if_exception(_is_retryable),
+            wait=_retry_wait,
+            stop=_retry_stop,
+            reraise=True,
+        ):
+            with attempt:
+                # Semaphore hanya dipegang selama request, tidak selama menunggu backoff
+                async with _YOUTUBE_SEM:
+                    response = await get_client().get("/videos", params=params)
+                response.raise_for_status()
+        data = orjson.loads(response.content)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 429:
+            backoff = _retry_after(e)
+            if backoff is None:
+                backoff = YOUTUBE_RATE_LIMIT_BACKOFF
+            _rate_limited_until = max(_rate_limited_until, time.monotonic() + backoff)
+            logger.warning(f"Rate limit YouTube API tercapai; request ditahan selama {backoff:g} detik.")
+            raise YouTubeRateLimited(math.ceil(backoff)) from e
+        logger.error(f"Kesalahan saat mengambil metadata: {e}")
+        return None
     except httpx.RequestError as e:
         logger.error(f"Permintaan HTTP gagal: {e}")
         return None
@@ -75,22 +453,28 @@ async def get_video_metadata(youtube_url: str) -> Optional[VideoMetadata]:
         logger.error(f"Kesalahan saat mengambil metadata: {e}")
         return None
 
-    if not data.get("items"):
-        logger.warning(f"Tidak ada video yang ditemukan untuk ID: {video_id}")
-        return None
+    return data.get("items") or []
+
+def _build_metadata(item: dict) -> VideoMetadata:
+    """
+    Membentuk VideoMetadata dari satu item respons videos.list.
 
-    item = data["items"][0]
+    Nilai sudah dikonversi ke tipe yang benar di sini, jadi model dibuat dengan
+    model_construct (tanpa validasi ulang pydantic). Field wajib selalu diberi default
+    agar item yang tidak lengkap (mis. tanpa thumbnail) tidak membuat request gagal.
+    """
     snippet = item.get("snippet", {})
     statistics = item.get("statistics", {})
     content_details = item.get("contentDetails", {})
+    published_at = snippet.get("publishedAt")
 
-    return VideoMetadata(
-        title=snippet.get("title", "No Title"),
+    return VideoMetadata.model_construct(
+        title=snippet.get("title") or "No Title",
         duration=_parse_duration(content_details.get("duration")),
-        thumbnail_url=snippet.get("thumbnails", {}).get("high", {}).get("url"),
-        channel_name=snippet.get("channelTitle", "Unknown Channel"),
+        thumbnail_url=snippet.get("thumbnails", {}).get("high", {}).get("url") or "",
+        channel_name=snippet.get("channelTitle") or "Unknown Channel",
         view_count=int(statistics.get("viewCount", 0)),
         like_count=int(statistics.get("likeCount", 0)),
-        published_at=datetime.fromisoformat(snippet["publishedAt"].replace("Z", "+00:00")) if "publishedAt" in snippet else None,
+        published_at=_parse_published_at(published_at) if published_at else None,
         description=snippet.get("description", "")
-    )
\ No newline at end of file
+    )